@@ -13,15 +13,27 @@ import pickle
 import numpy as np
 import pandas as pd
 # from flask import Flask, request, jsonify # Flask is already imported
-from flask import request, jsonify # request and jsonify are needed
+from flask import request, jsonify, Response, stream_with_context # request and jsonify are needed
 from werkzeug.utils import secure_filename
 import tensorflow as tf
-from collections import Counter
-from ecg_utils import preprocess_ecg, segment_ecg_beats # Assuming ecg_utils.py is in the same directory
+from ecg_utils import preprocess_ecg, segment_ecg_beats, normalize_segments, warm_up_kernels # Assuming ecg_utils.py is in the same directory
+from ecg_columns import find_ecg_column
+from batching import BatchingPredictor
+from middleware import GzipRequestMiddleware
+from inference import TFLitePredictor, convert_to_tflite, convert_to_tflite_isolated
 import logging
 import tempfile
 import time
 import gc
+import hashlib
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, Future
+
+try:
+    import pyarrow as pa
+    from pyarrow import csv as pa_csv
+except ImportError:  # Fall back to pandas' C parser
+    pa = None
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -33,43 +45,271 @@ CORS(app) # Apply CORS to the app instance
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024  # 100MB max file size for large ECG files
 
+# Accept gzip-compressed uploads; the 100MB limit applies to both the compressed and decompressed body
+app.wsgi_app = GzipRequestMiddleware(app.wsgi_app, max_content_length=app.config['MAX_CONTENT_LENGTH'])
+
+# Model batching: segments per model call, how long to wait for concurrent requests to join,
+# and how many segments to collect across requests (one recording is ~2,000-2,500 segments)
+BATCH_SIZE = int(os.environ.get('BATCH_SIZE', 100))
+BATCH_TIMEOUT_MS = float(os.environ.get('BATCH_TIMEOUT_MS', 5))
+BATCH_MAX_SEGMENTS = int(os.environ.get('BATCH_MAX_SEGMENTS', 16384))
+
+# Threads for filtering/R-peak detection/segmentation (NumPy, SciPy and Numba release the GIL)
+PREPROCESS_WORKERS = int(os.environ.get('PREPROCESS_WORKERS', os.cpu_count() or 1))
+
+# Inference backend: 'tflite' (converted at startup, falls back to Keras on failure) or 'keras'
+INFERENCE_BACKEND = os.environ.get('INFERENCE_BACKEND', 'tflite')
+# TFLite weights: 'none', 'dynamic', 'float16' or 'int8' (full integer, needs TFLITE_CALIBRATION_CSV)
+TFLITE_QUANTIZATION = os.environ.get('TFLITE_QUANTIZATION', 'none')
+TFLITE_CALIBRATION_CSV = os.environ.get('TFLITE_CALIBRATION_CSV')
+# Seconds to wait for the isolated int8 conversion process before falling back
+TFLITE_CONVERSION_TIMEOUT = float(os.environ.get('TFLITE_CONVERSION_TIMEOUT', 600))
+
+MODEL_PATH = 'cnn_lstm_ecg_classifier_v1.keras'
+SCALER_PATH = 'ecg_scaler.pkl'
+CLASS_MAPPING_PATH = 'class_mapping.pkl'
+
+# Uploads are parsed straight from the request stream; UPLOAD_TO_DISK=1 copies them to a temp file first
+UPLOAD_TO_DISK = os.environ.get('UPLOAD_TO_DISK', '0') == '1'
+
+# Request header marking uploads as client-extracted heartbeats (.npz with int16 `q` (n, 250),
+# `scale` and the original `samples` count) rather than continuous ECG
+PRE_SEGMENTED_HEADER = 'X-Pre-Segmented'
+
 # Create upload directory if it doesn't exist
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
+def load_ecg_signal(source):
+    """
+    Read only the ECG lead column of a CSV file as float32
+    
+    The header is read first to pick the lead, then the single column is parsed
+    with pyarrow (or pandas when pyarrow is not installed), so the other columns
+    are never materialized.
+    
+    Args:
+        source: Path to a CSV file or a seekable binary file object (e.g. an upload stream)
+    """
+    columns = list(pd.read_csv(source, nrows=0).columns)
+    ecg_column, col_idx = find_ecg_column(columns)
+    logger.info(f"Using column '{ecg_column}' as ECG signal")
+    
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    
+    if pa is not None:
+        table = pa_csv.read_csv(
+            source,
+            # Reuse pandas' header names so unnamed/duplicate columns resolve the same way
+            read_options=pa_csv.ReadOptions(column_names=columns, skip_rows=1),
+            convert_options=pa_csv.ConvertOptions(
+                include_columns=[ecg_column],
+                column_types={ecg_column: pa.float32()}
+            )
+        )
+        return table.column(0).to_numpy()
+    
+    df = pd.read_csv(source, usecols=[col_idx], dtype=np.float32, engine='c')
+    return df.iloc[:, 0].to_numpy()
+
+def load_ecg_array(source):
+    """
+    Read an ECG lead saved with np.save (.npy) as float32, skipping text parsing entirely
+    
+    Args:
+        source: Path to a .npy file or a seekable binary file object (e.g. an upload stream)
+    """
+    continuous_ecg = np.load(source, allow_pickle=False)
+    if continuous_ecg.ndim != 1:
+        raise ValueError(f"Expected a 1-D ECG signal array, got shape {continuous_ecg.shape}")
+    return continuous_ecg.astype(np.float32, copy=False)
+
+def load_npz_arrays(source, max_bytes=None):
+    """
+    Read the arrays of an uncompressed .npz archive, checking their size before loading
+    
+    Each member's .npy header is read first, so an archive declaring arrays larger
+    than max_bytes is rejected without allocating them. Compressed (deflated)
+    members are rejected outright: np.savez never writes them, and they could
+    expand far beyond the upload size limit.
+    
+    Args:
+        source: Path to a .npz file or a seekable binary file object (e.g. an upload stream)
+        max_bytes: Largest total array size to accept (defaults to MAX_CONTENT_LENGTH)
+    
+    Returns:
+        Dict mapping array names to arrays
+    """
+    if max_bytes is None:
+        max_bytes = app.config['MAX_CONTENT_LENGTH']
+    
+    header_readers = {
+        (1, 0): np.lib.format.read_array_header_1_0,
+        (2, 0): np.lib.format.read_array_header_2_0,
+    }
+    
+    with zipfile.ZipFile(source) as archive:
+        members = archive.infolist()
+        total_bytes = 0
+        for info in members:
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(f"Compressed .npz members are not supported: {info.filename}")
+            if not info.filename.endswith('.npy'):
+                raise ValueError(f"Unexpected .npz member: {info.filename}")
+            
+            with archive.open(info) as member:
+                version = np.lib.format.read_magic(member)
+                if version not in header_readers:
+                    raise ValueError(f"Unsupported .npy format version {version} in {info.filename}")
+                shape, _, dtype = header_readers[version](member)
+            
+            if dtype.hasobject:
+                raise ValueError(f"Object arrays are not supported: {info.filename}")
+            total_bytes += int(np.prod(shape, dtype=np.int64)) * dtype.itemsize
+            if total_bytes > max_bytes:
+                raise ValueError(f"Arrays in .npz upload exceed the {max_bytes} byte limit")
+        
+        arrays = {}
+        for info in members:
+            with archive.open(info) as member:
+                arrays[info.filename[:-4]] = np.lib.format.read_array(member, allow_pickle=False)
+        return arrays
+
+def load_ecg_quantized(source):
+    """
+    Read an int16-quantized ECG lead saved with np.savez (.npz) as float32
+    
+    The archive holds the samples as int16 `q` and the float `scale` that maps
+    them back to signal units (signal = q * scale).
+    
+    Args:
+        source: Path to a .npz file or a seekable binary file object (e.g. an upload stream)
+    """
+    data = load_npz_arrays(source)
+    quantized = data['q']
+    scale = np.float32(data['scale'])
+    
+    if quantized.ndim != 1:
+        raise ValueError(f"Expected a 1-D ECG signal array, got shape {quantized.shape}")
+    
+    continuous_ecg = quantized.astype(np.float32)
+    continuous_ecg *= scale
+    return continuous_ecg
+
+# Upload formats by file extension
+SIGNAL_LOADERS = {
+    'csv': load_ecg_signal,
+    'npy': load_ecg_array,
+    'npz': load_ecg_quantized,
+}
+
 # Global variables for loaded models and scalers
 model = None
+predict_fn = None
 scaler = None
 class_mapping = None
+model_version = None
+
+def file_digest(*paths):
+    """Return a short SHA-1 over the contents of the given files"""
+    digest = hashlib.sha1()
+    for path in paths:
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:12]
 
 def load_models():
     """Load the pre-trained model, scaler, and class mapping"""
-    global model, scaler, class_mapping
+    global model, predict_fn, scaler, class_mapping, model_version
     
     try:
         # Load the trained CNN+LSTM model
-        model = tf.keras.models.load_model('cnn_lstm_ecg_classifier_v1.keras')
+        model = tf.keras.models.load_model(MODEL_PATH)
         logger.info("Model loaded successfully")
         
         # Load the StandardScaler used during training
-        with open('ecg_scaler.pkl', 'rb') as f:
+        with open(SCALER_PATH, 'rb') as f:
             scaler = pickle.load(f)
         logger.info("Scaler loaded successfully")
         
         # Load class mapping (index -> diagnosis label)
-        with open('class_mapping.pkl', 'rb') as f:
+        with open(CLASS_MAPPING_PATH, 'rb') as f:
             class_mapping = pickle.load(f)
         logger.info("Class mapping loaded successfully")
         
+        # Convert to TFLite (XNNPACK kernels on CPU) for the prediction hot path
+        predict_fn = None
+        backend = 'keras'
+        if INFERENCE_BACKEND == 'tflite':
+            try:
+                tflite_model, quantization = build_tflite_model()
+                predict_fn = TFLitePredictor(tflite_model)
+                backend = f'tflite-{quantization}'
+                logger.info(f"Model converted to TensorFlow Lite (quantization: {quantization})")
+            except Exception as e:
+                logger.warning(f"TensorFlow Lite conversion failed, using Keras predict: {str(e)}")
+        
+        if predict_fn is None:
+            # Direct call through a traced graph avoids model.predict's per-call dataset setup
+            @tf.function(input_signature=[tf.TensorSpec([None, 250, 1], tf.float32)])
+            def _infer(x):
+                return model(x, training=False)
+            
+            _infer(tf.zeros([1, 250, 1], tf.float32))  # Trace once at startup
+            predict_fn = lambda batch: _infer(batch).numpy()
+            logger.info("Using Keras model for inference")
+        
+        # Identifies the model, scaler and class mapping contents and the inference backend,
+        # so clients can invalidate cached results when any of them changes
+        model_name = os.path.splitext(os.path.basename(MODEL_PATH))[0]
+        model_version = f"{model_name}-{file_digest(MODEL_PATH, SCALER_PATH, CLASS_MAPPING_PATH)}-{backend}"
+        logger.info(f"Model version: {model_version}")
+        
     except Exception as e:
         logger.error(f"Error loading models: {str(e)}")
         raise
 
-# Load models when the app starts
+def build_tflite_model():
+    """Convert the loaded model to TFLite, returning (model bytes, quantization used)"""
+    if TFLITE_QUANTIZATION != 'int8':
+        return convert_to_tflite(model, BATCH_SIZE, quantization=TFLITE_QUANTIZATION), TFLITE_QUANTIZATION
+    
+    try:
+        if not TFLITE_CALIBRATION_CSV:
+            raise ValueError("TFLITE_CALIBRATION_CSV must point to an ECG CSV file for calibration")
+        
+        # Calibrate on real segments run through the same preprocessing as requests
+        continuous_ecg = np.nan_to_num(load_ecg_signal(TFLITE_CALIBRATION_CSV), nan=0.0, posinf=0.0, neginf=0.0)
+        calibration_segments = segment_ecg_beats(continuous_ecg, scaler, segment_length=250)[:1000]
+        
+        return convert_to_tflite_isolated(MODEL_PATH, BATCH_SIZE, 'int8', calibration_segments,
+                                          timeout=TFLITE_CONVERSION_TIMEOUT), 'int8'
+        
+    except Exception as e:
+        # LSTM ops may lack int8 kernels; float16 weights keep accuracy
+        logger.warning(f"int8 quantization failed, using float16 weights instead: {str(e)}")
+        return convert_to_tflite(model, BATCH_SIZE, quantization='float16'), 'float16'
+
+# Compile the Numba preprocessing kernels, then load models when the app starts
+warm_up_kernels()
 load_models()
 
+# Bounded pool for CPU-heavy preprocessing so concurrent requests don't oversubscribe cores
+_POOL = ThreadPoolExecutor(max_workers=PREPROCESS_WORKERS, thread_name_prefix='ecg-preprocess')
+
+# Shared micro-batcher so concurrent requests share model calls
+batcher = BatchingPredictor(lambda batch: predict_fn(batch),
+                            max_batch_size=BATCH_SIZE,
+                            batch_timeout_ms=BATCH_TIMEOUT_MS,
+                            max_batch_segments=BATCH_MAX_SEGMENTS)
+
+def get_file_format(filename):
+    """Return the lowercase extension of an uploaded file name"""
+    return filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+
 def allowed_file(filename):
     """Check if the uploaded file has a valid extension"""
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() == 'csv'
+    return get_file_format(filename) in SIGNAL_LOADERS
 
 def safe_file_cleanup(filepath, max_retries=5, delay=0.1):
     """Safely delete a file with retries to handle Windows file locking"""
@@ -96,7 +336,8 @@ def health_check():
         'status': 'healthy',
         'model_loaded': model is not None,
         'scaler_loaded': scaler is not None,
-        'class_mapping_loaded': class_mapping is not None
+        'class_mapping_loaded': class_mapping is not None,
+        'model_version': model_version
     })
 
 @app.route('/predict', methods=['POST'])
@@ -115,23 +356,31 @@ def predict_ecg():
             return jsonify({'error': 'No file selected'}), 400
         
         if not allowed_file(file.filename):
-            return jsonify({'error': 'Invalid file type. Please upload a CSV file'}), 400
+            return jsonify({'error': 'Invalid file type. Please upload a CSV, NPY or NPZ file'}), 400
         
         filename = secure_filename(file.filename)
-        temp_fd, filepath = tempfile.mkstemp(suffix='.csv', prefix=f'ecg_{filename}_')
+        file_format = get_file_format(filename)
+        pre_segmented = request.headers.get(PRE_SEGMENTED_HEADER) == '1'
         
-        try:
-            with os.fdopen(temp_fd, 'wb') as temp_file:
-                file.save(temp_file)
-        except Exception as e:
+        if UPLOAD_TO_DISK:
+            temp_fd, filepath = tempfile.mkstemp(suffix=f'.{file_format}', prefix=f'ecg_{filename}_')
+            
             try:
-                os.close(temp_fd)
-            except:
-                pass
-            raise e
-        
-        logger.info(f"Processing uploaded file: {filename} (temp: {filepath})")
-        result = process_ecg_file(filepath)
+                with os.fdopen(temp_fd, 'wb') as temp_file:
+                    file.save(temp_file)
+            except Exception as e:
+                try:
+                    os.close(temp_fd)
+                except:
+                    pass
+                raise e
+            
+            logger.info(f"Processing uploaded file: {filename} (temp: {filepath})")
+            result = process_ecg_file(filepath, file_format, pre_segmented)
+        else:
+            # Parse directly from the upload stream, no extra copy on disk
+            logger.info(f"Processing uploaded file: {filename}")
+            result = process_ecg_file(file.stream, file_format, pre_segmented)
         
         # Check if processing itself returned an error (e.g. from process_ecg_file directly)
         if isinstance(result, tuple) and isinstance(result[0], dict) and 'error' in result[0]:
@@ -154,116 +403,156 @@ def predict_ecg():
         if filepath:
             safe_file_cleanup(filepath)
 
-def process_ecg_file(filepath):
+def _parse_signal(source, file_format='csv'):
+    """Pipeline stage 1: read the ECG lead and zero-fill non-finite samples"""
+    continuous_ecg = SIGNAL_LOADERS[file_format](source)
+    
+    if not np.isfinite(continuous_ecg).any():
+        raise ValueError("ECG signal contains no valid data after cleaning")
+    
+    # Fill NaN/inf in place instead of compacting, so sample indices keep matching the file
+    if not continuous_ecg.flags.writeable:  # zero-copy Arrow buffers are read-only
+        continuous_ecg = continuous_ecg.copy()
+    np.nan_to_num(continuous_ecg, copy=False, nan=0.0, posinf=0.0, neginf=0.0)
+    
+    if len(continuous_ecg) > 1000000:
+        logger.warning(f"Large ECG file detected ({len(continuous_ecg)} samples). "
+                      f"Consider using shorter recordings for faster processing.")
+    
+    logger.info(f"Loaded continuous ECG signal with {len(continuous_ecg)} samples")
+    return continuous_ecg
+
+def _parse_beats(source, file_format='npz'):
+    """Pipeline stage 1 for pre-segmented uploads: read client-extracted heartbeats"""
+    if file_format != 'npz':
+        raise ValueError("Pre-segmented uploads must be .npz files")
+    
+    data = load_npz_arrays(source)
+    quantized = data['q']
+    scale = np.float32(data['scale'])
+    continuous_samples = int(data['samples'])
+    
+    if quantized.ndim != 2 or quantized.shape[1] != 250:
+        raise ValueError(f"Expected heartbeat segments of shape (n, 250), got {quantized.shape}")
+    
+    beats = quantized.astype(np.float32)
+    beats *= scale
+    
+    logger.info(f"Loaded {len(beats)} pre-segmented heartbeats from {continuous_samples} samples")
+    return beats, continuous_samples
+
+def _scale_beats(beats):
+    """Pipeline stage 2 for pre-segmented uploads: validate and normalize segments (runs on _POOL)"""
+    X_segments = normalize_segments(beats, scaler, segment_length=250)
+    logger.info(f"Prepared data shape for model: {X_segments.shape}")
+    return X_segments
+
+def _segment_beats(continuous_ecg):
+    """Pipeline stage 2: filter, detect R-peaks, gather and scale segments (runs on _POOL)"""
+    X_segments = segment_ecg_beats(continuous_ecg, scaler, segment_length=250)
+    
+    if len(X_segments) == 0:
+        raise ValueError("No valid heartbeat segments extracted. "
+                       "Check if ECG signal contains detectable R-peaks.")
+    
+    logger.info(f"Successfully extracted {len(X_segments)} heartbeat segments "
+               f"of 250 samples each")
+    
+    logger.info(f"Prepared data shape for model: {X_segments.shape}")
+    return X_segments
+
+def _predict(X_segments):
+    """Pipeline stage 3: model inference through the shared micro-batcher"""
+    predictions = batcher.submit(X_segments).result()
+    logger.info(f"Generated predictions for {len(predictions)} heartbeat segments")
+    return predictions
+
+def _summarize_predictions(predictions, continuous_samples):
+    """Majority vote over per-segment predictions and the per-class breakdown"""
+    segment_classes = np.argmax(predictions, axis=1)
+    segment_confidences = np.max(predictions, axis=1)
+    
+    # Per-class vote counts and confidence sums in one pass each
+    n_classes = predictions.shape[1]
+    class_votes = np.bincount(segment_classes, minlength=n_classes)
+    confidence_sums = np.bincount(segment_classes, weights=segment_confidences, minlength=n_classes)
+    avg_confidences = confidence_sums / np.maximum(class_votes, 1)
+    
+    final_class_idx = int(class_votes.argmax())
+    final_diagnosis = class_mapping[final_class_idx]
+    
+    majority_segments = int(class_votes[final_class_idx])
+    majority_confidence = avg_confidences[final_class_idx]
+
+    segment_distribution = {}
+    total_segments = len(segment_classes)
+    
+    for class_idx_loop in np.nonzero(class_votes)[0]:
+        diagnosis_name = class_mapping[int(class_idx_loop)]
+        vote_count = int(class_votes[class_idx_loop])
+        
+        segment_distribution[diagnosis_name] = {
+            'segment_count': vote_count,
+            'percentage': round((vote_count / total_segments) * 100, 2) if total_segments > 0 else 0,
+            'avg_confidence': round(float(avg_confidences[class_idx_loop]), 4)
+        }
+    
+    return {
+        'predicted_diagnosis': final_diagnosis,
+        'overall_confidence': round(float(majority_confidence), 4),
+        'total_heartbeats': total_segments,
+        'continuous_samples': continuous_samples,
+        'segment_distribution': segment_distribution,
+        'preprocessing_success': True,
+        'majority_vote_count': majority_segments
+    }
+
+def _start_segmentation(source, file_format='csv', pre_segmented=False):
+    """Parse an upload on this thread and queue its segmentation on _POOL; returns (future, continuous samples)"""
+    if pre_segmented:
+        beats, continuous_samples = _parse_beats(source, file_format)
+        return _POOL.submit(_scale_beats, beats), continuous_samples
+    
+    continuous_ecg = _parse_signal(source, file_format)
+    return _POOL.submit(_segment_beats, continuous_ecg), len(continuous_ecg)
+
+def _submit_prediction(segmentation_future):
     """
-    Process continuous ECG file and return prediction results
+    Queue a file's segments on the shared batcher as soon as its segmentation finishes
+    
+    Returns a Future resolving to the file's predictions, so several files can be
+    in flight at once and the batcher can merge their model calls.
     """
-    df = None
-    try:
-        df = pd.read_csv(filepath)
-        
-        # UPDATED: Added 'ecg' (lowercase) to the list
-        possible_columns = ['MLII', 'MLI', 'V1', 'V2', 'Lead II', 'lead_II', 'ECG', 'ecg', '0', '1']
-        ecg_column = None
-        
-        for col_name_or_index in possible_columns:
-            try:
-                # Try as column name first
-                if col_name_or_index in df.columns:
-                    ecg_column = col_name_or_index
-                    break
-                # Try as integer index if it's a string representing an integer (like '0', '1')
-                elif isinstance(col_name_or_index, str) and col_name_or_index.isdigit():
-                    col_idx = int(col_name_or_index)
-                    if col_idx < len(df.columns):
-                         # Use the actual column name at this index for clarity in logs
-                        ecg_column = df.columns[col_idx]
-                        break
-            except ValueError: # If col_name_or_index cannot be converted to int
-                continue
-            except KeyError: # If df[col_name_or_index] fails
-                continue
-
-        if ecg_column is None:
-            available_columns = list(df.columns)
-            # This error will be caught by the calling function (predict_ecg)
-            raise ValueError(f"No valid ECG column found. Available columns: {available_columns}. "
-                           f"Expected one of: {possible_columns}")
-        
-        logger.info(f"Using column '{ecg_column}' as ECG signal")
-        continuous_ecg = df[ecg_column].values.astype(np.float32)
-        
-        del df; df = None; gc.collect()
-        
-        continuous_ecg = continuous_ecg[~np.isnan(continuous_ecg)]
-        continuous_ecg = continuous_ecg[np.isfinite(continuous_ecg)]
-        
-        if len(continuous_ecg) == 0:
-            raise ValueError("ECG signal contains no valid data after cleaning")
-        
-        if len(continuous_ecg) > 1000000:
-            logger.warning(f"Large ECG file detected ({len(continuous_ecg)} samples). "
-                          f"Consider using shorter recordings for faster processing.")
-        
-        logger.info(f"Loaded continuous ECG signal with {len(continuous_ecg)} samples")
-        heartbeat_segments = segment_ecg_beats(continuous_ecg, scaler, segment_length=250)
-        
-        if len(heartbeat_segments) == 0:
-            raise ValueError("No valid heartbeat segments extracted. "
-                           "Check if ECG signal contains detectable R-peaks.")
-        
-        logger.info(f"Successfully extracted {len(heartbeat_segments)} heartbeat segments "
-                   f"of 250 samples each")
-        
-        X_segments = np.array(heartbeat_segments)
-        X_segments = X_segments.reshape(X_segments.shape[0], X_segments.shape[1], 1)
-        logger.info(f"Prepared data shape for model: {X_segments.shape}")
-        
-        batch_size = 100
-        all_predictions = []
-        all_confidences = []
-        
-        for i in range(0, len(X_segments), batch_size):
-            batch = X_segments[i:i+batch_size]
-            batch_predictions = model.predict(batch, verbose=0)
-            all_predictions.extend(np.argmax(batch_predictions, axis=1))
-            all_confidences.extend(np.max(batch_predictions, axis=1))
-        
-        segment_classes = np.array(all_predictions)
-        segment_confidences = np.array(all_confidences)
-        logger.info(f"Generated predictions for {len(segment_classes)} heartbeat segments")
-        
-        class_votes = Counter(segment_classes)
-        final_class_idx = max(class_votes, key=class_votes.get)
-        final_diagnosis = class_mapping[final_class_idx]
-        
-        majority_segments = class_votes[final_class_idx]
-        majority_confidence_values = [conf for i, conf in enumerate(segment_confidences) if segment_classes[i] == final_class_idx]
-        majority_confidence = np.mean(majority_confidence_values) if majority_confidence_values else 0.0
+    result = Future()
+    
+    def on_predicted(prediction_future):
+        try:
+            result.set_result(prediction_future.result())
+        except Exception as e:
+            result.set_exception(e)
+    
+    def on_segmented(future):
+        try:
+            batcher.submit(future.result()).add_done_callback(on_predicted)
+        except Exception as e:
+            result.set_exception(e)
+    
+    segmentation_future.add_done_callback(on_segmented)
+    return result
 
-        segment_distribution = {}
-        total_segments = len(segment_classes)
-        
-        for class_idx_loop, vote_count in class_votes.items():
-            diagnosis_name = class_mapping[class_idx_loop]
-            current_segment_confidences = [conf for i, conf in enumerate(segment_confidences) if segment_classes[i] == class_idx_loop]
-            avg_confidence = np.mean(current_segment_confidences) if current_segment_confidences else 0.0
-            
-            segment_distribution[diagnosis_name] = {
-                'segment_count': vote_count,
-                'percentage': round((vote_count / total_segments) * 100, 2) if total_segments > 0 else 0,
-                'avg_confidence': round(float(avg_confidence), 4)
-            }
-        
-        return {
-            'predicted_diagnosis': final_diagnosis,
-            'overall_confidence': round(float(majority_confidence), 4),
-            'total_heartbeats': total_segments,
-            'continuous_samples': len(continuous_ecg),
-            'segment_distribution': segment_distribution,
-            'preprocessing_success': True,
-            'majority_vote_count': majority_segments
-        }
+def process_ecg_file(source, file_format='csv', pre_segmented=False):
+    """
+    Process continuous ECG file (path or binary file object) and return prediction results
+    
+    Parsing (CSV, .npy or .npz, by file_format) runs on the request thread, the CPU-heavy segmentation stage on the
+    bounded _POOL, and inference on the shared batcher. With pre_segmented, the upload
+    holds heartbeats already extracted by the client and only validation and scaling run.
+    """
+    try:
+        future, continuous_samples = _start_segmentation(source, file_format, pre_segmented)
+        X_segments = future.result()
+        predictions = _predict(X_segments)
+        return _summarize_predictions(predictions, continuous_samples)
         
     except ValueError as ve: # Catch ValueError specifically to return a more specific error
         logger.error(f"ValueError in ECG preprocessing: {str(ve)}")
@@ -277,10 +566,6 @@ def process_ecg_file(filepath):
     except Exception as e:
         logger.error(f"Generic error in ECG preprocessing pipeline: {str(e)}")
         raise # Re-raise to be caught by predict_ecg's main exception handler
-    finally:
-        if df is not None:
-            del df
-        gc.collect()
 
 @app.route('/classes', methods=['GET'])
 def get_classes():
@@ -297,6 +582,10 @@ def get_classes():
 def predict_ecg_batch():
     """
     Batch processing endpoint for multiple ECG files
+    
+    The response is streamed: the batch_results array is opened right away and
+    each file's result is written as soon as its predictions are ready, in
+    upload order, with the totals after it.
     """
     try:
         if 'files' not in request.files:
@@ -306,54 +595,79 @@ def predict_ecg_batch():
         if not files or all(f.filename == '' for f in files):
             return jsonify({'error': 'No files selected'}), 400
         
-        results = []
-        for file_item in files: # Renamed 'file' to 'file_item' to avoid conflict
-            if file_item.filename != '' and allowed_file(file_item.filename):
-                filepath_batch = None # Ensure filepath_batch is defined for the finally block
-                try:
-                    filename_batch = secure_filename(file_item.filename)
-                    temp_fd_batch, filepath_batch = tempfile.mkstemp(suffix='.csv', prefix=f'ecg_batch_{filename_batch}_')
-                    
+        pre_segmented = request.headers.get(PRE_SEGMENTED_HEADER) == '1'
+        
+        def start_files():
+            """Parse every file and queue its segmentation and inference; returns per-file entries"""
+            entries = []  # error dict, or (filename, upload name, prediction future, continuous samples)
+            for file_item in files: # Renamed 'file' to 'file_item' to avoid conflict
+                if file_item.filename != '' and allowed_file(file_item.filename):
+                    filepath_batch = None # Ensure filepath_batch is defined for the finally block
                     try:
-                        with os.fdopen(temp_fd_batch, 'wb') as temp_file_batch:
-                            file_item.save(temp_file_batch)
+                        filename_batch = secure_filename(file_item.filename)
+                        file_format_batch = get_file_format(filename_batch)
                         
-                        result_batch = process_ecg_file(filepath_batch)
-                        # Check if processing itself returned an error
-                        if isinstance(result_batch, tuple) and isinstance(result_batch[0], dict) and 'error' in result_batch[0]:
-                            results.append({
-                                'filename': filename_batch,
-                                'error': result_batch[0]['error'],
-                                'preprocessing_success': False
-                            })
-                        else:
-                            result_batch['filename'] = filename_batch
-                            results.append(result_batch)
+                        try:
+                            if UPLOAD_TO_DISK:
+                                temp_fd_batch, filepath_batch = tempfile.mkstemp(suffix=f'.{file_format_batch}', prefix=f'ecg_batch_{filename_batch}_')
+                                with os.fdopen(temp_fd_batch, 'wb') as temp_file_batch:
+                                    file_item.save(temp_file_batch)
+                                
+                                future, continuous_samples = _start_segmentation(filepath_batch, file_format_batch, pre_segmented)
+                            else:
+                                future, continuous_samples = _start_segmentation(file_item.stream, file_format_batch, pre_segmented)
+                            
+                        finally: # Changed from except to finally for cleanup
+                            # This was os.close(temp_fd_batch) which is wrong, should be safe_file_cleanup
+                            if filepath_batch: # Ensure filepath_batch was assigned
+                               safe_file_cleanup(filepath_batch)
                         
-                    finally: # Changed from except to finally for cleanup
-                        # This was os.close(temp_fd_batch) which is wrong, should be safe_file_cleanup
-                        if filepath_batch: # Ensure filepath_batch was assigned
-                           safe_file_cleanup(filepath_batch)
-                        
-                except Exception as e_batch:
-                    results.append({
-                        'filename': file_item.filename, # Use file_item.filename
-                        'error': str(e_batch),
-                        'preprocessing_success': False
-                    })
-            elif file_item.filename != '': # If file is not empty but not allowed
-                 results.append({
-                        'filename': file_item.filename,
-                        'error': 'Invalid file type. Only CSV allowed.',
-                        'preprocessing_success': False
-                    })
-
-
-        return jsonify({
-            'batch_results': results,
-            'total_files': len(files), # Use len(files) for total attempts
-            'successful_predictions': len([r for r in results if r.get('preprocessing_success', False)])
-        })
+                        # Files are segmented concurrently on the preprocessing pool, and each goes to
+                        # the shared batcher as soon as it is segmented (the batcher merges model calls)
+                        entries.append((filename_batch, file_item.filename, _submit_prediction(future), continuous_samples))
+                            
+                    except Exception as e_batch:
+                        entries.append({
+                            'filename': file_item.filename, # Use file_item.filename
+                            'error': str(e_batch),
+                            'preprocessing_success': False
+                        })
+                elif file_item.filename != '': # If file is not empty but not allowed
+                     entries.append({
+                            'filename': file_item.filename,
+                            'error': 'Invalid file type. Only CSV, NPY and NPZ allowed.',
+                            'preprocessing_success': False
+                        })
+            return entries
+        
+        def generate_results():
+            """Emit the JSON body piece by piece; per-file errors are reported inline so it always closes"""
+            yield '{"batch_results": ['
+            
+            successful = 0
+            for index, entry in enumerate(start_files()):
+                if isinstance(entry, dict):
+                    result_batch = entry
+                else:
+                    filename_batch, upload_name, future, continuous_samples = entry
+                    try:
+                        result_batch = _summarize_predictions(future.result(), continuous_samples)
+                        result_batch['filename'] = filename_batch
+                    except Exception as e_batch:
+                        logger.error(f"Error processing batch file {upload_name}: {str(e_batch)}")
+                        result_batch = {
+                            'filename': upload_name,
+                            'error': str(e_batch),
+                            'preprocessing_success': False
+                        }
+                
+                successful += bool(result_batch.get('preprocessing_success', False))
+                yield (',' if index else '') + app.json.dumps(result_batch)
+            
+            yield f'], "total_files": {len(files)}, "successful_predictions": {successful}}}'
+        
+        # Stream the JSON body (chunked) so clients can handle results before the last one is ready
+        return Response(stream_with_context(generate_results()), mimetype='application/json')
         
     except Exception as e:
         logger.error(f"Error in batch processing: {str(e)}")
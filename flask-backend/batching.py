@@ -0,0 +1,111 @@
+# batching.py - Cross-request micro-batching for model inference
+import queue
+import threading
+import time
+import logging
+from concurrent.futures import Future
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+class _PendingRequest:
+    """Segments submitted by one request and the future waiting for their predictions"""
+    __slots__ = ('x', 'future')
+
+    def __init__(self, x, future):
+        self.x = x
+        self.future = future
+
+class BatchingPredictor:
+    """
+    Coalesce concurrent prediction requests into shared model calls
+
+    A single daemon worker thread owns the model. It takes the first pending
+    request from the queue, keeps collecting more until `max_batch_segments`
+    segments are pending or `batch_timeout_ms` has passed, runs the model over
+    the concatenated segments in chunks of `max_batch_size`, and hands each
+    request its own slice. A single recording yields thousands of segments, so
+    the collection limit has to be well above the model chunk size for
+    requests to be merged at all.
+
+    Args:
+        predict_fn: Callable mapping an (n, ...) array to an (n, n_classes) array
+        max_batch_size: Segments per model call
+        batch_timeout_ms: How long to wait for other requests to join a batch
+        max_batch_segments: Cap on segments collected into one batch (defaults to max_batch_size)
+    """
+
+    def __init__(self, predict_fn, max_batch_size=100, batch_timeout_ms=5, max_batch_segments=None):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_batch_segments = max(max_batch_segments or max_batch_size, max_batch_size)
+        self.batch_timeout = batch_timeout_ms / 1000.0
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name='batching-predictor', daemon=True)
+        self._worker.start()
+
+    def submit(self, x):
+        """Queue segments for prediction and return a Future resolving to their predictions"""
+        future = Future()
+        self._queue.put(_PendingRequest(x, future))
+        return future
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            items = [first]
+            pending = len(first.x)
+            deadline = time.monotonic() + self.batch_timeout
+
+            while pending < self.max_batch_segments:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                items.append(item)
+                pending += len(item.x)
+
+            try:
+                self._process(items)
+            except Exception as e:
+                # Keep the only worker alive: fail this batch's requests and carry on
+                logger.error(f"Batching worker error for {len(items)} request(s): {str(e)}")
+                for item in items:
+                    if not item.future.done():
+                        item.future.set_exception(e)
+
+    def _process(self, items):
+        try:
+            if len(items) == 1:
+                batch = items[0].x
+            else:
+                batch = np.concatenate([item.x for item in items])
+
+            # Fill one preallocated output array chunk by chunk
+            predictions = None
+            for i in range(0, len(batch), self.max_batch_size):
+                chunk = self.predict_fn(batch[i:i + self.max_batch_size])
+                if predictions is None:
+                    predictions = np.empty((len(batch),) + chunk.shape[1:], dtype=chunk.dtype)
+                predictions[i:i + len(chunk)] = chunk
+            if predictions is None:  # Empty batch: the model call still gives the output shape
+                predictions = np.asarray(self.predict_fn(batch))
+
+            if len(items) > 1:
+                logger.info(f"Batched {len(items)} requests into {len(batch)} segments")
+
+            offset = 0
+            for item in items:
+                n = len(item.x)
+                item.future.set_result(predictions[offset:offset + n])
+                offset += n
+
+        except Exception as e:
+            logger.error(f"Batched prediction failed for {len(items)} request(s): {str(e)}")
+            for item in items:
+                if not item.future.done():
+                    item.future.set_exception(e)
@@ -0,0 +1,22 @@
+# ecg_columns.py - ECG lead selection shared by the server and the test client
+# (no heavy imports, so the client can use it without loading ecg_utils)
+
+def find_ecg_column(columns):
+    """Return (column name, position) of the ECG lead to use, or raise ValueError"""
+    # UPDATED: Added 'ecg' (lowercase) to the list
+    possible_columns = ['MLII', 'MLI', 'V1', 'V2', 'Lead II', 'lead_II', 'ECG', 'ecg', '0', '1']
+    
+    for col_name_or_index in possible_columns:
+        # Try as column name first
+        if col_name_or_index in columns:
+            return col_name_or_index, columns.index(col_name_or_index)
+        # Try as integer index if it's a string representing an integer (like '0', '1')
+        elif col_name_or_index.isdigit():
+            col_idx = int(col_name_or_index)
+            if col_idx < len(columns):
+                # Use the actual column name at this index for clarity in logs
+                return columns[col_idx], col_idx
+    
+    # This error will be caught by the calling function (predict_ecg)
+    raise ValueError(f"No valid ECG column found. Available columns: {columns}. "
+                     f"Expected one of: {possible_columns}")
@@ -3,18 +3,251 @@ import numpy as np
 import pandas as pd
 from scipy import signal
 from sklearn.preprocessing import StandardScaler
+from numba import njit, prange, threading_layer
+from functools import lru_cache
+from contextlib import nullcontext
+import threading
 import logging
 import gc
 
 logger = logging.getLogger(__name__)
 
-def preprocess_ecg(ecg_signal, sampling_rate=360):
+def design_bandpass(sampling_rate=360, low_hz=0.5, high_hz=40.0, order=4):
+    """
+    Design the Butterworth bandpass used by preprocess_ecg as second-order sections
+    
+    Args:
+        sampling_rate: Sampling rate in Hz
+        low_hz: Lower cutoff frequency in Hz
+        high_hz: Upper cutoff frequency in Hz
+        order: Butterworth filter order
+    
+    Returns:
+        Tuple of (sos, zi) where zi holds the per-section steady-state filter state
+    """
+    nyquist = sampling_rate / 2
+    low_freq = low_hz / nyquist
+    high_freq = high_hz / nyquist
+    
+    # Ensure frequencies are within valid range
+    low_freq = max(low_freq, 0.001)
+    high_freq = min(high_freq, 0.999)
+    
+    sos = signal.butter(order, [low_freq, high_freq], btype='band', output='sos')
+    zi = signal.sosfilt_zi(sos)
+    return sos, zi
+
+@njit(cache=True, fastmath=True, nogil=True)
+def sosfiltfilt_nb(sos, zi, x, y, work):
+    """
+    Zero-phase forward/backward SOS filter (same result as scipy.signal.sosfiltfilt)
+    
+    The signal is extended with odd reflections of length 3 * (2 * n_sections + 1)
+    and each pass starts from the steady-state initial conditions in `zi`
+    scaled by the first sample. All sections are cascaded per sample so the
+    signal is traversed once per direction.
+    
+    Args:
+        sos: Second-order sections, shape (n_sections, 6)
+        zi: Steady-state initial conditions, shape (n_sections, 2)
+        x: Input signal
+        y: Output buffer with the same length as x
+        work: float64 work buffer of at least filtfilt_work_size(len(x), n_sections) elements
+    """
+    n = x.shape[0]
+    n_sections = sos.shape[0]
+    padlen = min(3 * (2 * n_sections + 1), n - 1)
+    
+    # Odd reflection padding written directly into the work buffer
+    ext = work[:n + 2 * padlen]
+    for i in range(padlen):
+        ext[i] = 2.0 * x[0] - x[padlen - i]
+        ext[n + padlen + i] = 2.0 * x[n - 1] - x[n - 2 - i]
+    for i in range(n):
+        ext[padlen + i] = x[i]
+    
+    m = ext.shape[0]
+    z = np.empty((n_sections, 2), dtype=np.float64)
+    
+    # Forward pass, cascading every section per sample
+    x0 = ext[0]
+    for s in range(n_sections):
+        z[s, 0] = zi[s, 0] * x0
+        z[s, 1] = zi[s, 1] * x0
+    for i in range(m):
+        v = ext[i]
+        for s in range(n_sections):
+            yi = sos[s, 0] * v + z[s, 0]
+            z[s, 0] = sos[s, 1] * v - sos[s, 4] * yi + z[s, 1]
+            z[s, 1] = sos[s, 2] * v - sos[s, 5] * yi
+            v = yi
+        ext[i] = v
+    
+    # Backward pass
+    x0 = ext[m - 1]
+    for s in range(n_sections):
+        z[s, 0] = zi[s, 0] * x0
+        z[s, 1] = zi[s, 1] * x0
+    for i in range(m - 1, -1, -1):
+        v = ext[i]
+        for s in range(n_sections):
+            yi = sos[s, 0] * v + z[s, 0]
+            z[s, 0] = sos[s, 1] * v - sos[s, 4] * yi + z[s, 1]
+            z[s, 1] = sos[s, 2] * v - sos[s, 5] * yi
+            v = yi
+        ext[i] = v
+    
+    for i in range(n):
+        y[i] = ext[padlen + i]
+
+def filtfilt_work_size(n, n_sections):
+    """Return the sosfiltfilt_nb work buffer length for an n-sample signal"""
+    return n + 2 * 3 * (2 * n_sections + 1)
+
+# Fast-math flags minus nnan/ninf, which would let LLVM drop the isfinite checks
+_FASTMATH_FINITE_SAFE = {'nsz', 'arcp', 'contract', 'afn', 'reassoc'}
+
+@njit(parallel=True, fastmath=_FASTMATH_FINITE_SAFE, cache=True)
+def gather_validate_scale(sig, peaks, mean, inv_scale, out, keep):
+    """
+    Gather, validate and scale heartbeat segments in one parallel pass over the peaks
+    
+    Each segment is checked on its raw filtered values with the same rules as
+    validate_segments (all finite, std >= 1e-6, max |value| <= 100) and written
+    to `out` scaled as (x - mean) * inv_scale. Rows with keep[k] False are
+    left partially written.
+    
+    Args:
+        sig: Filtered ECG signal
+        peaks: R-peak indices whose full segment lies inside `sig`
+        mean: Per-sample scaler mean, shape (segment_length,)
+        inv_scale: Per-sample inverse scaler scale, shape (segment_length,)
+        out: Output buffer, shape (n_peaks, segment_length)
+        keep: Boolean output buffer, shape (n_peaks,)
+    """
+    segment_length = out.shape[1]
+    half_length = segment_length // 2
+    
+    for k in prange(peaks.shape[0]):
+        start = peaks[k] - half_length
+        
+        # Raw values: finiteness, amplitude and running sum for the mean
+        ok = True
+        total = 0.0
+        amax = 0.0
+        for j in range(segment_length):
+            v = sig[start + j]
+            if not np.isfinite(v):
+                ok = False
+                break
+            total += v
+            if abs(v) > amax:
+                amax = abs(v)
+        
+        if ok:
+            # Second pass for the variance (segment is in cache) and the scaled output
+            mu = total / segment_length
+            sq = 0.0
+            for j in range(segment_length):
+                v = sig[start + j]
+                sq += (v - mu) * (v - mu)
+                out[k, j] = (v - mean[j]) * inv_scale[j]
+            ok = np.sqrt(sq / segment_length) >= 1e-6 and amax <= 100.0
+        
+        keep[k] = ok
+
+# Input-independent constants for the MIT-BIH sampling rate and model segment length,
+# built once at import; other rates/lengths are computed per call
+_SAMPLING_RATE = 360
+_SEGMENT_LENGTH = 250
+_BANDPASS_SOS, _BANDPASS_ZI = design_bandpass(_SAMPLING_RATE)
+_SEGMENT_OFFSETS = np.arange(-(_SEGMENT_LENGTH // 2), _SEGMENT_LENGTH - _SEGMENT_LENGTH // 2)
+
+# Numba's fallback 'workqueue' layer aborts on concurrent parallel launches from
+# several threads (the preprocessing pool), so launches are serialized until
+# warm_up_kernels() finds a thread-safe layer (tbb/omp)
+_PARALLEL_LAUNCH_LOCK = threading.Lock()
+
+def warm_up_kernels():
+    """
+    Compile the Numba kernels and start the parallel threading layer
+    
+    Called once by the server at startup (on the main thread) so the first
+    request doesn't pay for compilation. Importing this module has no such side
+    effects, so clients that only reuse the helpers compile on first use.
+    """
+    global _PARALLEL_LAUNCH_LOCK
+    
+    sosfiltfilt_nb(_BANDPASS_SOS, _BANDPASS_ZI, np.zeros(1, dtype=np.float32), np.empty(1, dtype=np.float32),
+                   np.empty(filtfilt_work_size(1, len(_BANDPASS_SOS)), dtype=np.float64))
+    gather_validate_scale(np.zeros(_SEGMENT_LENGTH, dtype=np.float32), np.array([_SEGMENT_LENGTH // 2], dtype=np.intp),
+                          np.zeros(_SEGMENT_LENGTH, dtype=np.float32), np.ones(_SEGMENT_LENGTH, dtype=np.float32),
+                          np.empty((1, _SEGMENT_LENGTH), dtype=np.float32), np.empty(1, dtype=np.bool_))
+    
+    if threading_layer() != 'workqueue':
+        _PARALLEL_LAUNCH_LOCK = nullcontext()
+    logger.info(f"Compiled preprocessing kernels (Numba threading layer: {threading_layer()})")
+
+# Per-thread reusable work buffers for intermediates that never leave segment_ecg_beats
+_scratch = threading.local()
+
+# Scratch buffers above this size are dropped after use, so one very large upload
+# doesn't keep hundreds of MB pinned on every pool thread
+SCRATCH_MAX_RETAINED_BYTES = 32 * 1024 * 1024
+
+def scratch_buffer(name, size, dtype=np.float32):
+    """
+    Return a length-`size` view of a reusable per-thread buffer
+    
+    The buffer grows to max(size, 1.5 * capacity) when too small and is otherwise
+    reused, so repeated requests on the same worker thread don't reallocate. The
+    view is overwritten by the next call with the same name on this thread, so it
+    must not be returned to callers.
+    
+    Args:
+        name: Buffer name, one buffer per name and thread
+        size: Number of elements needed
+        dtype: Element type
+    """
+    buf = getattr(_scratch, name, None)
+    if buf is None or buf.dtype != dtype or buf.shape[0] < size:
+        capacity = size if buf is None else max(size, int(1.5 * buf.shape[0]))
+        buf = np.empty(capacity, dtype=dtype)
+        setattr(_scratch, name, buf)
+    return buf[:size]
+
+def release_scratch(max_bytes=SCRATCH_MAX_RETAINED_BYTES):
+    """Drop this thread's scratch buffers larger than max_bytes (smaller ones are kept for reuse)"""
+    for name, buf in list(vars(_scratch).items()):
+        if buf.nbytes > max_bytes:
+            delattr(_scratch, name)
+
+@lru_cache(maxsize=None)
+def scaler_params(scaler):
+    """
+    Cache a fitted StandardScaler's per-feature mean and inverse scale as float32
+    
+    Args:
+        scaler: Fitted StandardScaler
+    
+    Returns:
+        Tuple of (mean, inv_scale) so that (x - mean) * inv_scale == scaler.transform(x)
+    """
+    n_features = scaler.n_features_in_
+    mean = scaler.mean_ if scaler.with_mean else np.zeros(n_features)
+    inv_scale = 1.0 / scaler.scale_ if scaler.with_std else np.ones(n_features)
+    return mean.astype(np.float32), inv_scale.astype(np.float32)
+
+def preprocess_ecg(ecg_signal, sampling_rate=360, out=None, work=None):
     """
     Preprocess ECG signal with filtering and noise reduction
     
     Args:
         ecg_signal: Raw ECG signal array
         sampling_rate: Sampling rate in Hz (default 360 for MIT-BIH)
+        out: Optional float32 output buffer with the same length as ecg_signal
+        work: Optional float64 filter work buffer of at least
+              filtfilt_work_size(len(ecg_signal), n_sections) elements
     
     Returns:
         Filtered ECG signal
@@ -23,34 +256,39 @@ def preprocess_ecg(ecg_signal, sampling_rate=360):
         # Convert to numpy array and handle memory efficiently
         ecg_signal = np.asarray(ecg_signal, dtype=np.float32)
         
+        if out is None:
+            out = np.empty_like(ecg_signal)
+        
         # Remove DC offset
-        ecg_signal = ecg_signal - np.mean(ecg_signal)
+        np.subtract(ecg_signal, np.mean(ecg_signal), out=out)
         
-        # Apply bandpass filter (0.5-40 Hz)
-        nyquist = sampling_rate / 2
-        low_freq = 0.5 / nyquist
-        high_freq = 40.0 / nyquist
+        # Apply bandpass filter (0.5-40 Hz); the kernel pads into the separate work
+        # buffer before writing, so it can filter `out` in place
+        if sampling_rate == _SAMPLING_RATE:
+            sos, zi = _BANDPASS_SOS, _BANDPASS_ZI
+        else:
+            sos, zi = design_bandpass(sampling_rate)
         
-        # Ensure frequencies are within valid range
-        low_freq = max(low_freq, 0.001)
-        high_freq = min(high_freq, 0.999)
+        work_size = filtfilt_work_size(len(out), len(sos))
+        if work is None or len(work) < work_size:
+            work = np.empty(work_size, dtype=np.float64)
         
-        b, a = signal.butter(4, [low_freq, high_freq], btype='band')
-        filtered_signal = signal.filtfilt(b, a, ecg_signal)
+        sosfiltfilt_nb(sos, zi, out, out, work)
         
-        return filtered_signal
+        return out
         
     except Exception as e:
         logger.error(f"Error in ECG preprocessing: {str(e)}")
         raise
 
-def detect_r_peaks_scipy(ecg_signal, sampling_rate=360):
+def detect_r_peaks_scipy(ecg_signal, sampling_rate=360, out=None):
     """
     Robust R-peak detection using scipy with multiple fallback strategies
     
     Args:
         ecg_signal: Preprocessed ECG signal
         sampling_rate: Sampling rate in Hz
+        out: Optional work buffer for the normalized signal, same length and dtype as ecg_signal
     
     Returns:
         Array of R-peak indices
@@ -58,12 +296,17 @@ def detect_r_peaks_scipy(ecg_signal, sampling_rate=360):
     try:
         from scipy.signal import find_peaks
         
-        # Normalize signal for peak detection
-        normalized_signal = (ecg_signal - np.mean(ecg_signal)) / (np.std(ecg_signal) + 1e-8)
+        # Normalize signal for peak detection into a single buffer
+        mu = ecg_signal.mean()
+        sigma = ecg_signal.std() + 1e-8
+        normalized_signal = np.subtract(ecg_signal, mu, out=out)
+        np.divide(normalized_signal, sigma, out=normalized_signal)
+        
+        # Both adaptive thresholds from one selection pass over the signal
+        lenient_threshold, height_threshold = np.percentile(normalized_signal, [60, 75])
         
         # Strategy 1: Standard R-peak detection
         min_distance = int(0.6 * sampling_rate)  # 600ms minimum distance between peaks
-        height_threshold = np.percentile(normalized_signal, 75)  # Adaptive threshold
         
         r_peaks, properties = find_peaks(
             normalized_signal,
@@ -78,7 +321,7 @@ def detect_r_peaks_scipy(ecg_signal, sampling_rate=360):
             logger.warning("Few R-peaks detected, trying more lenient parameters")
             r_peaks, properties = find_peaks(
                 normalized_signal,
-                height=np.percentile(normalized_signal, 60),
+                height=lenient_threshold,
                 distance=int(0.4 * sampling_rate),  # 400ms minimum
                 prominence=0.1
             )
@@ -130,13 +373,14 @@ def detect_r_peaks_wfdb(ecg_signal, sampling_rate=360):
         logger.warning(f"WFDB R-peak detection failed: {str(e)}")
         raise
 
-def detect_r_peaks(ecg_signal, sampling_rate=360):
+def detect_r_peaks(ecg_signal, sampling_rate=360, out=None):
     """
     Detect R-peaks with multiple fallback strategies
     
     Args:
         ecg_signal: Preprocessed ECG signal
         sampling_rate: Sampling rate in Hz
+        out: Optional work buffer passed to detect_r_peaks_scipy
     
     Returns:
         Array of R-peak indices
@@ -148,7 +392,7 @@ def detect_r_peaks(ecg_signal, sampling_rate=360):
             logger.info(f"Used WFDB for R-peak detection: {len(r_peaks)} peaks")
         except:
             # Strategy 2: Fall back to scipy
-            r_peaks = detect_r_peaks_scipy(ecg_signal, sampling_rate)
+            r_peaks = detect_r_peaks_scipy(ecg_signal, sampling_rate, out=out)
             logger.info(f"Used scipy for R-peak detection: {len(r_peaks)} peaks")
         
         # Filter out peaks too close to signal boundaries
@@ -181,25 +425,23 @@ def extract_heartbeat_segments(ecg_signal, r_peaks, segment_length=250):
         segment_length: Length of each segment (default 250 samples)
     
     Returns:
-        List of heartbeat segments
+        Array of heartbeat segments, shape (n_segments, segment_length)
     """
-    segments = []
     half_length = segment_length // 2
     
     try:
-        for r_peak in r_peaks:
-            start_idx = r_peak - half_length
-            end_idx = r_peak + half_length
-            
-            # Check if segment is within signal boundaries
-            if start_idx >= 0 and end_idx < len(ecg_signal):
-                segment = ecg_signal[start_idx:end_idx]
-                
-                # Ensure segment is exactly the required length
-                if len(segment) == segment_length:
-                    segments.append(segment)
-                else:
-                    logger.warning(f"Segment length mismatch: expected {segment_length}, got {len(segment)}")
+        r_peaks = np.asarray(r_peaks, dtype=np.intp)
+        
+        # Keep only peaks whose full segment lies within signal boundaries
+        in_bounds = (r_peaks >= half_length) & (r_peaks - half_length + segment_length <= len(ecg_signal))
+        valid_peaks = r_peaks[in_bounds]
+        
+        # Gather all segments at once with an (n_peaks, segment_length) index matrix
+        if segment_length == _SEGMENT_LENGTH:
+            offsets = _SEGMENT_OFFSETS
+        else:
+            offsets = np.arange(-half_length, segment_length - half_length)
+        segments = ecg_signal[valid_peaks[:, None] + offsets[None, :]]
         
         logger.info(f"Extracted {len(segments)} valid segments from {len(r_peaks)} R-peaks")
         return segments
@@ -213,41 +455,65 @@ def validate_segments(segments, expected_length=250):
     Validate extracted segments for quality and consistency
     
     Args:
-        segments: List of heartbeat segments
+        segments: Array of heartbeat segments, shape (n_segments, segment_length)
         expected_length: Expected length of each segment
     
     Returns:
-        List of validated segments
+        Array of validated segments
     """
-    valid_segments = []
+    segments = np.asarray(segments)
     
-    for i, segment in enumerate(segments):
-        try:
-            # Check length
-            if len(segment) != expected_length:
-                continue
-                
-            # Check for NaN or infinite values
-            if np.any(np.isnan(segment)) or np.any(np.isinf(segment)):
-                continue
-                
-            # Check for flat signals (all zeros or constant values)
-            if np.std(segment) < 1e-6:
-                continue
-                
-            # Check for reasonable amplitude range
-            if np.max(np.abs(segment)) > 100:  # Unusually high amplitude
-                continue
-                
-            valid_segments.append(segment)
-            
-        except Exception as e:
-            logger.warning(f"Error validating segment {i}: {str(e)}")
-            continue
+    # Check length
+    if segments.ndim != 2 or segments.shape[1] != expected_length:
+        logger.warning(f"Segment shape mismatch: expected (n, {expected_length}), got {segments.shape}")
+        return segments[:0].reshape(0, expected_length)
+    
+    # Check for NaN or infinite values
+    finite = np.isfinite(segments).all(axis=1)
     
+    # Check for flat signals (all zeros or constant values)
+    non_flat = segments.std(axis=1) >= 1e-6
+    
+    # Check for reasonable amplitude range
+    in_range = np.abs(segments).max(axis=1) <= 100  # Unusually high amplitude otherwise
+    
+    keep = finite & non_flat & in_range
+    valid_segments = segments[keep]
     logger.info(f"Validated {len(valid_segments)} segments out of {len(segments)}")
     return valid_segments
 
+def normalize_segments(segments, scaler, segment_length=250):
+    """
+    Validate already-extracted heartbeat segments and normalize them with the training scaler
+    
+    Steps 4 and 5 of segment_ecg_beats for segments that were filtered and cut
+    around R-peaks elsewhere (e.g. by the client).
+    
+    Args:
+        segments: Filtered, unscaled heartbeat segments, shape (n_segments, segment_length)
+        scaler: Pre-trained StandardScaler (same one used during model training)
+        segment_length: Fixed segment length (250 samples to match training)
+    
+    Returns:
+        float32 array of normalized heartbeat segments, shape (n_segments, segment_length, 1)
+    """
+    try:
+        validated_segments = validate_segments(np.asarray(segments, dtype=np.float32), segment_length)
+        
+        if len(validated_segments) == 0:
+            raise ValueError("No valid heartbeat segments after quality validation.")
+        
+        # Same as scaler.transform, in place on the copy made by validate_segments
+        scaler_mean, scaler_inv_scale = scaler_params(scaler)
+        np.subtract(validated_segments, scaler_mean, out=validated_segments)
+        np.multiply(validated_segments, scaler_inv_scale, out=validated_segments)
+        
+        return validated_segments.reshape(-1, segment_length, 1)
+        
+    except Exception as e:
+        logger.error(f"Error normalizing heartbeat segments: {str(e)}")
+        raise
+
 def segment_ecg_beats(continuous_ecg, scaler, segment_length=250, sampling_rate=360):
     """
     CRITICAL PREPROCESSING PIPELINE: Convert continuous ECG to model-ready heartbeat segments
@@ -266,17 +532,27 @@ def segment_ecg_beats(continuous_ecg, scaler, segment_length=250, sampling_rate=
         sampling_rate: ECG sampling rate in Hz (360 Hz for MIT-BIH)
     
     Returns:
-        List of normalized 250-sample heartbeat segments ready for CNN+LSTM model
+        float32 array of normalized heartbeat segments, shape (n_segments, segment_length, 1),
+        ready for the CNN+LSTM model
     """
     try:
         logger.info(f"Starting preprocessing pipeline for {len(continuous_ecg)} continuous samples")
         
+        # Intermediates live in this thread's scratch buffers; only the validated
+        # segments (a fresh copy from the boolean keep mask) are returned
+        n_samples = len(continuous_ecg)
+        
         # Step 1: Filter and clean the continuous signal
-        filtered_signal = preprocess_ecg(continuous_ecg, sampling_rate)
+        filtered_signal = preprocess_ecg(continuous_ecg, sampling_rate,
+                                         out=scratch_buffer('filtered', n_samples),
+                                         work=scratch_buffer('filter_work',
+                                                             filtfilt_work_size(n_samples, len(_BANDPASS_SOS)),
+                                                             np.float64))
         logger.info("Applied bandpass filter and noise reduction")
         
         # Step 2: Detect R-peaks in the continuous signal
-        r_peaks = detect_r_peaks(filtered_signal, sampling_rate)
+        r_peaks = detect_r_peaks(filtered_signal, sampling_rate,
+                                 out=scratch_buffer('peak_work', n_samples))
         
         if len(r_peaks) == 0:
             raise ValueError("No R-peaks detected in continuous ECG signal. "
@@ -284,33 +560,42 @@ def segment_ecg_beats(continuous_ecg, scaler, segment_length=250, sampling_rate=
         
         logger.info(f"Detected {len(r_peaks)} R-peaks in continuous signal")
         
-        # Step 3: Extract fixed-length segments around each R-peak
-        raw_segments = extract_heartbeat_segments(filtered_signal, r_peaks, segment_length)
+        # Steps 3-5: Extract segments around each R-peak, validate them and
+        # normalize using the SAME scaler from training, fused into one parallel pass
+        half_length = segment_length // 2
+        r_peaks = np.asarray(r_peaks, dtype=np.intp)
+        in_bounds = (r_peaks >= half_length) & (r_peaks - half_length + segment_length <= n_samples)
+        valid_peaks = r_peaks[in_bounds]
         
-        if len(raw_segments) == 0:
+        if len(valid_peaks) == 0:
             raise ValueError("No valid heartbeat segments extracted. "
                            "R-peaks may be too close to signal boundaries.")
         
-        logger.info(f"Extracted {len(raw_segments)} raw heartbeat segments")
+        logger.info(f"Extracted {len(valid_peaks)} raw heartbeat segments")
         
-        # Step 4: Validate segments for quality
-        validated_segments = validate_segments(raw_segments, segment_length)
+        scaler_mean, scaler_inv_scale = scaler_params(scaler)
+        if len(scaler_mean) != segment_length:
+            raise ValueError(f"Scaler expects {len(scaler_mean)} samples per segment, got {segment_length}")
         
-        if len(validated_segments) == 0:
-            raise ValueError("No valid heartbeat segments after quality validation.")
+        scaled_segments = scratch_buffer('segments', len(valid_peaks) * segment_length).reshape(-1, segment_length)
+        keep = scratch_buffer('keep', len(valid_peaks), np.bool_)
+        with _PARALLEL_LAUNCH_LOCK:
+            gather_validate_scale(filtered_signal, valid_peaks, scaler_mean, scaler_inv_scale,
+                                  scaled_segments, keep)
         
-        if len(validated_segments) < len(raw_segments) * 0.5:
-            logger.warning(f"Many segments filtered out: {len(validated_segments)}/{len(raw_segments)} remain")
+        # Boolean indexing copies, so the returned segments don't alias the scratch buffer
+        normalized_segments = scaled_segments[keep]
+        logger.info(f"Validated {len(normalized_segments)} segments out of {len(valid_peaks)}")
         
-        # Step 5: CRITICAL - Normalize using the SAME scaler from training
-        # This ensures compatibility with the trained model
-        segments_array = np.array(validated_segments, dtype=np.float32)
+        if len(normalized_segments) == 0:
+            raise ValueError("No valid heartbeat segments after quality validation.")
         
-        # Handle potential memory issues with large arrays
-        if segments_array.nbytes > 500 * 1024 * 1024:  # More than 500MB
-            logger.warning(f"Large segment array detected: {segments_array.nbytes / (1024*1024):.1f} MB")
+        if len(normalized_segments) < len(valid_peaks) * 0.5:
+            logger.warning(f"Many segments filtered out: {len(normalized_segments)}/{len(valid_peaks)} remain")
         
-        normalized_segments = scaler.transform(segments_array)
+        # Handle potential memory issues with large arrays
+        if normalized_segments.nbytes > 500 * 1024 * 1024:  # More than 500MB
+            logger.warning(f"Large segment array detected: {normalized_segments.nbytes / (1024*1024):.1f} MB")
         
         logger.info(f"Applied normalization using training scaler. "
                    f"Segment stats: mean={np.mean(normalized_segments):.4f}, "
@@ -322,11 +607,14 @@ def segment_ecg_beats(continuous_ecg, scaler, segment_length=250, sampling_rate=
                            f"got {normalized_segments.shape[1]}")
         
         # Force garbage collection to free memory
-        del segments_array, validated_segments, raw_segments, filtered_signal
+        del scaled_segments, keep, filtered_signal
         gc.collect()
         
-        return normalized_segments.tolist()
+        return normalized_segments.astype(np.float32, copy=False).reshape(-1, segment_length, 1)
         
     except Exception as e:
         logger.error(f"Error in continuous ECG to segments pipeline: {str(e)}")
-        raise
\ No newline at end of file
+        raise
+    
+    finally:
+        release_scratch()
\ No newline at end of file
@@ -0,0 +1,173 @@
+# inference.py - TensorFlow Lite inference path for the CNN+LSTM classifier
+import os
+import sys
+import faulthandler
+import logging
+import subprocess
+import tempfile
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.python.framework.convert_to_constants import convert_variables_to_constants_v2
+
+logger = logging.getLogger(__name__)
+
+def convert_to_tflite(model, batch_size, segment_length=250, quantization='none',
+                      representative_segments=None):
+    """
+    Convert a Keras model to a TensorFlow Lite flatbuffer with a fixed batch size
+
+    The LSTM layers lower to tensor-list ops that TFLite can only legalize with
+    static shapes, so the batch dimension is fixed and the variables are frozen
+    into constants before conversion.
+
+    Args:
+        model: Loaded Keras model
+        batch_size: Batch dimension baked into the converted model
+        segment_length: Samples per heartbeat segment
+        quantization: 'none' (float32), 'dynamic' (int8 weights), 'float16' (fp16 weights)
+                      or 'int8' (full integer, calibrated on representative_segments)
+        representative_segments: Normalized (n, segment_length, 1) segments for int8 calibration
+
+    Returns:
+        Serialized TFLite model bytes
+    """
+    infer = tf.function(lambda x: model(x, training=False), autograph=False,
+                        input_signature=[tf.TensorSpec([batch_size, segment_length, 1], tf.float32)])
+    frozen = convert_variables_to_constants_v2(infer.get_concrete_function())
+
+    converter = tf.lite.TFLiteConverter.from_concrete_functions([frozen])
+    if quantization == 'dynamic':
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    elif quantization == 'float16':
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.target_spec.supported_types = [tf.float16]
+    elif quantization == 'int8':
+        if representative_segments is None or len(representative_segments) < batch_size:
+            raise ValueError(f"int8 quantization needs at least {batch_size} representative segments")
+
+        segments = np.asarray(representative_segments, dtype=np.float32)
+
+        def representative_dataset():
+            for start in range(0, len(segments) - batch_size + 1, batch_size):
+                yield [segments[start:start + batch_size]]
+
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        converter.inference_input_type = tf.int8
+        converter.inference_output_type = tf.int8
+    elif quantization != 'none':
+        raise ValueError(f"Unknown TFLite quantization mode: {quantization}")
+
+    return converter.convert()
+
+def convert_to_tflite_isolated(model_path, batch_size, quantization, representative_segments=None,
+                               timeout=600):
+    """
+    Run convert_to_tflite for a saved model in a separate Python process
+
+    Full-integer calibration of the LSTM while-loop can crash the converter
+    natively rather than raise, so it is kept out of the server process. A crash
+    or a conversion running longer than `timeout` seconds is reported as
+    RuntimeError, with the tail of the converter's stderr for crashes.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        segments_path = os.path.join(tmp_dir, 'segments.npy')
+        output_path = os.path.join(tmp_dir, 'model.tflite')
+        np.save(segments_path, np.asarray(representative_segments, dtype=np.float32))
+
+        try:
+            result = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), model_path, str(batch_size),
+                 quantization, segments_path, output_path],
+                capture_output=True, text=True, timeout=timeout
+            )
+        except subprocess.TimeoutExpired:
+            raise RuntimeError(f"TFLite conversion process timed out after {timeout}s")
+
+        if result.returncode != 0:
+            # Crash reason and innermost frames, minus faulthandler's long extension module list
+            lines = [line for line in result.stderr.splitlines()
+                     if line.strip() and not line.startswith('Extension modules:')]
+            tail = lines[-6:]
+            fatal = [line for line in lines if line.startswith('Fatal Python error')]
+            if fatal and fatal[-1] not in tail:
+                tail.insert(0, fatal[-1])
+            stderr_tail = '\n'.join(tail)
+            raise RuntimeError(f"TFLite conversion process exited with code {result.returncode}: {stderr_tail}")
+
+        with open(output_path, 'rb') as f:
+            return f.read()
+
+class TFLitePredictor:
+    """
+    Callable wrapper around a TFLite interpreter with the same contract as model.predict
+
+    Batches shorter than the converted batch size are zero-padded and longer ones
+    are run in chunks. For full-integer models, inputs are quantized and outputs
+    dequantized with the interpreter's scale/zero-point. The interpreter is not
+    thread-safe, so calls must come from a single thread (the BatchingPredictor worker).
+
+    Args:
+        tflite_model: Serialized TFLite model from convert_to_tflite
+        num_threads: Interpreter threads (defaults to the CPU count)
+    """
+
+    def __init__(self, tflite_model, num_threads=None):
+        self.interpreter = tf.lite.Interpreter(model_content=tflite_model,
+                                               num_threads=num_threads or os.cpu_count())
+        self.interpreter.allocate_tensors()
+
+        input_details = self.interpreter.get_input_details()[0]
+        output_details = self.interpreter.get_output_details()[0]
+        self._input_index = input_details['index']
+        self._output_index = output_details['index']
+        self.batch_size = int(input_details['shape'][0])
+        self._input_buffer = np.zeros(input_details['shape'], dtype=input_details['dtype'])
+        self._n_outputs = int(output_details['shape'][1])
+        self._input_dtype = input_details['dtype']
+        self._input_quantization = input_details['quantization']
+        self._output_quantization = output_details['quantization'] if output_details['dtype'] != np.float32 else None
+
+    def _prepare_input(self, chunk):
+        if self._input_dtype == np.float32:
+            return chunk
+        scale, zero_point = self._input_quantization
+        info = np.iinfo(self._input_dtype)
+        quantized = np.round(chunk / scale) + zero_point
+        return np.clip(quantized, info.min, info.max).astype(self._input_dtype)
+
+    def __call__(self, batch):
+        predictions = np.empty((len(batch), self._n_outputs), dtype=np.float32)
+
+        for start in range(0, len(batch), self.batch_size):
+            chunk = self._prepare_input(batch[start:start + self.batch_size])
+            n = len(chunk)
+
+            if n == self.batch_size:
+                self.interpreter.set_tensor(self._input_index, np.ascontiguousarray(chunk, dtype=self._input_dtype))
+            else:
+                # Pad the trailing partial chunk; padded rows are discarded below
+                self._input_buffer[:n] = chunk
+                self._input_buffer[n:] = 0
+                self.interpreter.set_tensor(self._input_index, self._input_buffer)
+
+            self.interpreter.invoke()
+            output = self.interpreter.get_tensor(self._output_index)[:n]
+            if self._output_quantization is not None:
+                scale, zero_point = self._output_quantization
+                output = (output.astype(np.float32) - zero_point) * scale
+            predictions[start:start + n] = output
+
+        return predictions
+
+if __name__ == '__main__':
+    # Entry point for convert_to_tflite_isolated; report native crashes on stderr
+    faulthandler.enable()
+    model_path, batch_size, quantization, segments_path, output_path = sys.argv[1:]
+    tflite_model = convert_to_tflite(tf.keras.models.load_model(model_path), int(batch_size),
+                                     quantization=quantization,
+                                     representative_segments=np.load(segments_path))
+    with open(output_path, 'wb') as f:
+        f.write(tflite_model)
@@ -0,0 +1,45 @@
+# middleware.py - WSGI middleware for compressed request bodies
+import gzip
+import json
+
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.wrappers import Response
+from werkzeug.wsgi import get_input_stream
+
+class GzipRequestMiddleware:
+    """
+    Decompress request bodies sent with `Content-Encoding: gzip` before Flask sees them
+
+    The compressed body is read through a stream bounded by its Content-Length
+    (or by max_content_length for chunked uploads) and replaced with a streaming
+    gzip reader. The decompressed length isn't known up front, so Content-Length
+    is dropped and the input is marked terminated; Flask then applies its own
+    MAX_CONTENT_LENGTH to the decompressed data.
+
+    Args:
+        app: WSGI application to wrap
+        max_content_length: Limit on the compressed body size in bytes
+    """
+
+    def __init__(self, app, max_content_length=None):
+        self.app = app
+        self.max_content_length = max_content_length
+
+    def __call__(self, environ, start_response):
+        if environ.get('HTTP_CONTENT_ENCODING', '').strip().lower() == 'gzip':
+            try:
+                compressed = get_input_stream(environ, max_content_length=self.max_content_length)
+            except RequestEntityTooLarge:
+                # Raised before Flask sees the request, so answer with the app's JSON 413 body here
+                return self._too_large(environ, start_response)
+            environ['wsgi.input'] = gzip.GzipFile(fileobj=compressed, mode='rb')
+            environ['wsgi.input_terminated'] = True
+            environ.pop('CONTENT_LENGTH', None)
+            del environ['HTTP_CONTENT_ENCODING']
+
+        return self.app(environ, start_response)
+
+    def _too_large(self, environ, start_response):
+        limit_mb = self.max_content_length // (1024 * 1024)
+        body = json.dumps({'error': f'File too large. Maximum size is {limit_mb}MB'})
+        return Response(body, status=413, mimetype='application/json')(environ, start_response)